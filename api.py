@@ -1,19 +1,25 @@
 import os
 import re
 import asyncio
+import functools
+import importlib
+import time
 import uuid
 from datetime import datetime, timezone, timedelta, date
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional, Callable
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional, Callable
 import difflib
 
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from telethon import TelegramClient
-from telethon.sessions import StringSession
+
+if TYPE_CHECKING:
+    # Telethon is imported lazily so the process can bind its port sooner.
+    from telethon import TelegramClient
 
 from db import (
     init_db,
@@ -36,6 +42,10 @@ THROTTLE_SECONDS = 0.0
 TEXT_DEDUP_RATIO = 0.95
 MAX_PARALLEL_CHANNELS = 4
 FUZZY_DEDUP_MAX_ROWS = 1500
+PRESET_CHANNELS_FILE = Path(__file__).with_name("web") / "app.js"
+PRESET_RESOLVE_INTERVAL_SECONDS = 1.0
+PRESET_WARMUP_WINDOW_SECONDS = 60 * 10
+WARMUP_RETRY_MAX_SECONDS = 60
 
 load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
 
@@ -55,6 +65,21 @@ JOBS: Dict[str, Dict[str, object]] = {}
 JOB_TTL_SECONDS = 60 * 30
 JOB_MAX_ITEMS = 200
 
+WARMUP: Dict[str, object] = {
+    "db": False,
+    "db_error": None,
+    "telegram": False,
+    "telegram_error": None,
+    "channels_resolved": 0,
+    "channels_total": 0,
+    "done": False,
+}
+DB_READY = asyncio.Event()
+ENTITY_CACHE: Dict[str, object] = {}
+_client: Optional["TelegramClient"] = None
+_client_lock = asyncio.Lock()
+_resolve_flood_until = 0.0
+
 origins = ["*"] if CORS_ORIGINS.strip() == "*" else [o.strip() for o in CORS_ORIGINS.split(",") if o.strip()]
 app.add_middleware(
     CORSMiddleware,
@@ -97,14 +122,139 @@ class SearchStatusResponse(BaseModel):
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     if not API_ID or not API_HASH:
         raise RuntimeError("TG_API_ID/TG_API_HASH are required")
-    init_db()
-    _ensure_guest_user()
+    asyncio.create_task(_warmup())
     asyncio.create_task(_jobs_gc_loop())
 
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    if _client is not None:
+        await _client.disconnect()
+
+
+async def _warmup():
+    # DB setup and the guest PBKDF2 are blocking, keep them off the loop.
+    try:
+        await asyncio.to_thread(init_db)
+        await asyncio.to_thread(_ensure_guest_user)
+        WARMUP["db"] = True
+    except Exception as e:
+        WARMUP["db_error"] = str(e)
+    finally:
+        # Let waiting requests through and surface the real error there.
+        DB_READY.set()
+
+    delay = 5
+    while True:
+        try:
+            client = await _get_client()
+            break
+        except Exception as e:
+            WARMUP["telegram_error"] = str(e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+
+    try:
+        await _warm_preset_channels(client)
+    except Exception as e:
+        WARMUP["telegram_error"] = str(e)
+    finally:
+        WARMUP["done"] = True
+
+
+async def _warm_preset_channels(client: "TelegramClient"):
+    presets = await asyncio.to_thread(_load_preset_channels)
+    WARMUP["channels_total"] = len(presets)
+    # ResolveUsername is heavily rate-limited: resolve one preset at a time
+    # and sit out FloodWaits, but only within the first minutes after boot.
+    # Whatever is left after that resolves lazily on its first search.
+    deadline = time.monotonic() + PRESET_WARMUP_WINDOW_SECONDS
+    for ch in presets:
+        while True:
+            if await _get_entity(client, ch) is not None:
+                WARMUP["channels_resolved"] = int(WARMUP["channels_resolved"]) + 1
+                break
+            if not _resolve_flood_active():
+                break
+            if _resolve_flood_until > deadline:
+                return
+            await asyncio.sleep(_resolve_flood_until - time.monotonic())
+        await asyncio.sleep(PRESET_RESOLVE_INTERVAL_SECONDS)
+
+
+def _load_preset_channels() -> List[str]:
+    try:
+        source = PRESET_CHANNELS_FILE.read_text(encoding="utf-8")
+    except OSError:
+        return []
+    return _normalize_channels(re.findall(r"https?://t\.me/[A-Za-z0-9_/]+", source))
+
+
+@functools.lru_cache(maxsize=None)
+def _tl_types():
+    return importlib.import_module("telethon.tl.types")
+
+
+@functools.lru_cache(maxsize=None)
+def _stale_channel_errors() -> Tuple[type, ...]:
+    errors = importlib.import_module("telethon.errors")
+    return (errors.ChannelInvalidError, errors.ChannelPrivateError)
+
+
+async def _get_client() -> "TelegramClient":
+    global _client
+    async with _client_lock:
+        if _client is None:
+            # The first Telethon import is slow, keep it off the event loop.
+            await asyncio.to_thread(importlib.import_module, "telethon")
+            from telethon import TelegramClient
+            from telethon.sessions import StringSession
+
+            session = StringSession(TG_STRING_SESSION) if TG_STRING_SESSION else SESSION_NAME
+            _client = TelegramClient(session, int(API_ID), API_HASH)
+        if not _client.is_connected():
+            try:
+                await _client.connect()
+            except Exception:
+                WARMUP["telegram"] = False
+                raise
+            # connect() doesn't log in, a revoked or empty session only shows up here.
+            if not await _client.is_user_authorized():
+                await _client.disconnect()
+                WARMUP["telegram"] = False
+                raise RuntimeError("Telegram session is not authorized")
+        WARMUP["telegram"] = True
+        WARMUP["telegram_error"] = None
+        return _client
+
+
+def _resolve_flood_active() -> bool:
+    return time.monotonic() < _resolve_flood_until
+
+
+async def _get_entity(client: "TelegramClient", ch: str, fresh: bool = False):
+    global _resolve_flood_until
+    entity = None if fresh else ENTITY_CACHE.get(ch.lower())
+    if entity is not None:
+        return entity
+    if _resolve_flood_active():
+        return None
+    try:
+        # get_entity always asks the server, bypassing the session's cache.
+        entity = await (client.get_entity(ch) if fresh else client.get_input_entity(ch))
+    except Exception as e:
+        # FloodWait on ResolveUsername is account-wide, don't retry until it expires.
+        seconds = getattr(e, "seconds", None)
+        if seconds:
+            _resolve_flood_until = time.monotonic() + seconds
+        return None
+    ENTITY_CACHE[ch.lower()] = entity
+    return entity
+
+
 async def _jobs_gc_loop():
     while True:
         _cleanup_jobs()
@@ -278,11 +428,66 @@ def _is_video(msg) -> bool:
     return False
 
 
-def _video_fingerprint(msg) -> Optional[str]:
+def _fp_hash(*parts: object) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        if isinstance(p, bytes):
+            h.update(p)
+        else:
+            h.update(str(p).encode("utf-8"))
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def _video_fingerprints(msg) -> List[str]:
+    """All keys under which this message's clip can be recognised again.
+
+    A re-upload to another channel gets a new document id, so besides
+    `doc:` we index the post origin (own post or `fwd_from`), the
+    size/duration/resolution of the file and the inline thumbnail.
+    """
+    fps: List[str] = []
+
+    peer_channel = getattr(getattr(msg, "peer_id", None), "channel_id", None)
+    if peer_channel and getattr(msg, "id", None):
+        fps.append(f"post:{peer_channel}:{msg.id}")
+
+    fwd = getattr(msg, "fwd_from", None)
+    if fwd:
+        fwd_channel = getattr(getattr(fwd, "from_id", None), "channel_id", None)
+        if fwd_channel and getattr(fwd, "channel_post", None):
+            fps.append(f"post:{fwd_channel}:{fwd.channel_post}")
+        saved_channel = getattr(getattr(fwd, "saved_from_peer", None), "channel_id", None)
+        if saved_channel and getattr(fwd, "saved_from_msg_id", None):
+            fps.append(f"post:{saved_channel}:{fwd.saved_from_msg_id}")
+
     doc = getattr(msg, "document", None)
-    if doc and getattr(doc, "id", None):
-        return f"doc:{doc.id}"
-    return None
+    if not doc:
+        return fps
+    if getattr(doc, "id", None):
+        fps.append(f"doc:{doc.id}")
+
+    types = _tl_types()
+    video_attr = None
+    for attr in getattr(doc, "attributes", None) or []:
+        if isinstance(attr, types.DocumentAttributeVideo):
+            video_attr = attr
+            break
+    duration = getattr(video_attr, "duration", None)
+
+    size = getattr(doc, "size", None)
+    if size and video_attr is not None:
+        fps.append("meta:" + _fp_hash(size, duration, video_attr.w, video_attr.h))
+
+    if video_attr is not None:
+        for thumb in getattr(doc, "thumbs", None) or []:
+            if isinstance(thumb, (types.PhotoStrippedSize, types.PhotoCachedSize)) and thumb.bytes:
+                # Inline thumbs are tiny and lossy (intro cards, black frames),
+                # so only trust them together with duration and resolution.
+                fps.append("thumb:" + _fp_hash(thumb.bytes, duration, video_attr.w, video_attr.h))
+                break
+
+    return fps
 
 
 async def _search_videos_and_texts(
@@ -296,19 +501,54 @@ async def _search_videos_and_texts(
     progress_cb: Optional[Callable[[float, str], None]] = None,
 ) -> Tuple[List[str], List[Tuple[str, str]]]:
     found: Dict[str, Tuple[datetime, str, str]] = {}
+    # Every fingerprint of a stored clip -> its key in `found`.
+    fp_index: Dict[str, str] = {}
     end_inclusive = end + timedelta(seconds=1)
-    session = StringSession(TG_STRING_SESSION) if TG_STRING_SESSION else SESSION_NAME
     sem = asyncio.Semaphore(max(1, min(MAX_PARALLEL_CHANNELS, len(channels) or 1)))
     found_lock = asyncio.Lock()
     done_channels = 0
     total_channels = max(1, len(channels))
 
-    async def process_channel(client: TelegramClient, ch: str):
+    async def search_keyword(client: "TelegramClient", entity, ch: str, kw: str):
+        async for msg in client.iter_messages(entity, search=kw, offset_date=end_inclusive):
+            if not msg or not msg.date:
+                continue
+
+            msg_date = msg.date
+            if msg_date.tzinfo is None:
+                msg_date = msg_date.replace(tzinfo=timezone.utc)
+
+            if msg_date > end:
+                continue
+            if msg_date < start:
+                break
+
+            if videos_only and (not _is_video(msg)):
+                continue
+
+            text = (msg.message or "").strip()
+            if _text_has_excludes(text, exclude_keywords):
+                continue
+
+            link = f"https://t.me/{ch}/{msg.id}"
+            fps = _video_fingerprints(msg) or [f"link:{link}"]
+            async with found_lock:
+                key = next((fp_index[fp] for fp in fps if fp in fp_index), None)
+                if key is None:
+                    key = fps[0]
+                    found[key] = (msg_date, link, text)
+                # Index dropped copies too, so later re-uploads chain to them.
+                for fp in fps:
+                    fp_index.setdefault(fp, key)
+
+            if throttle > 0:
+                await asyncio.sleep(throttle)
+
+    async def process_channel(client: "TelegramClient", ch: str):
         nonlocal done_channels
         async with sem:
-            try:
-                entity = await client.get_entity(ch)
-            except Exception:
+            entity = await _get_entity(client, ch)
+            if entity is None:
                 if progress_cb:
                     done_channels += 1
                     progress_cb(min(0.95, (done_channels / total_channels) * 0.95), f"@{ch} — пропуск")
@@ -318,41 +558,33 @@ async def _search_videos_and_texts(
                 if progress_cb:
                     progress_cb(min(0.95, (done_channels / total_channels) * 0.95), f"@{ch} — «{kw}»")
 
-                async for msg in client.iter_messages(entity, search=kw, offset_date=end_inclusive):
-                    if not msg or not msg.date:
+                try:
+                    await search_keyword(client, entity, ch, kw)
+                    continue
+                except _stale_channel_errors():
+                    # Cached entity went stale (username moved, channel went
+                    # private): resolve once more, otherwise skip the channel.
+                    ENTITY_CACHE.pop(ch.lower(), None)
+
+                entity = await _get_entity(client, ch, fresh=True)
+                if entity is not None:
+                    try:
+                        await search_keyword(client, entity, ch, kw)
                         continue
+                    except _stale_channel_errors():
+                        ENTITY_CACHE.pop(ch.lower(), None)
 
-                    msg_date = msg.date
-                    if msg_date.tzinfo is None:
-                        msg_date = msg_date.replace(tzinfo=timezone.utc)
-
-                    if msg_date > end:
-                        continue
-                    if msg_date < start:
-                        break
-
-                    if videos_only and (not _is_video(msg)):
-                        continue
-
-                    text = (msg.message or "").strip()
-                    if _text_has_excludes(text, exclude_keywords):
-                        continue
-
-                    link = f"https://t.me/{ch}/{msg.id}"
-                    fp = _video_fingerprint(msg) or f"link:{link}"
-                    async with found_lock:
-                        if fp not in found:
-                            found[fp] = (msg_date, link, text)
-
-                    if throttle > 0:
-                        await asyncio.sleep(throttle)
+                done_channels += 1
+                if progress_cb:
+                    progress_cb(min(0.95, (done_channels / total_channels) * 0.95), f"@{ch} — пропуск")
+                return
 
             done_channels += 1
             if progress_cb:
                 progress_cb(min(0.95, (done_channels / total_channels) * 0.95), f"@{ch} — готово")
 
-    async with TelegramClient(session, int(API_ID), API_HASH) as client:
-        await asyncio.gather(*(process_channel(client, ch) for ch in channels))
+    client = await _get_client()
+    await asyncio.gather(*(process_channel(client, ch) for ch in channels))
 
     final = sorted(found.values(), key=lambda x: x[0])
     rows = [(link, text) for _, link, text in final]
@@ -365,11 +597,12 @@ async def _search_videos_and_texts(
     return links_only, rows
 
 
-def _get_user_from_token(auth_header: Optional[str]):
+async def _get_user_from_token(auth_header: Optional[str]):
+    await DB_READY.wait()
     guest = get_user_by_email(GUEST_EMAIL)
     if guest:
         return guest
-    _ensure_guest_user()
+    await asyncio.to_thread(_ensure_guest_user)
     guest = get_user_by_email(GUEST_EMAIL)
     if guest:
         return guest
@@ -380,7 +613,7 @@ def _get_user_from_token(auth_header: Optional[str]):
 
 @app.post("/search", response_model=SearchResponse)
 async def search(req: SearchRequest):
-    user = _get_user_from_token(None)
+    user = await _get_user_from_token(None)
 
     # Access gating temporarily disabled by request.
 
@@ -472,7 +705,7 @@ async def _run_job(job_id: str, req: SearchRequest):
 
 @app.post("/search/start", response_model=StartSearchResponse)
 async def start_search(req: SearchRequest):
-    user = _get_user_from_token(None)
+    user = await _get_user_from_token(None)
 
     channels = _normalize_channels(req.channels)
     keywords = _normalize_keywords(req.keywords)
@@ -528,6 +761,20 @@ def search_status(job_id: str):
 
 
 
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "version": APP_VERSION}
+
+
+@app.get("/readyz")
+def readyz():
+    ready = bool(WARMUP["db"]) and bool(WARMUP["telegram"])
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, **WARMUP},
+    )
+
+
 @app.get("/version")
 def version():
     return {"version": APP_VERSION}
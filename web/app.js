@@ -339,3 +339,6 @@ window.addEventListener('keydown', (e) => {
 });
 
 updateRunState();
+
+// Wake the API early so it warms up while the user fills in the form.
+apiFetch('/healthz').catch(() => {});